@@ -1,49 +1,205 @@
+import collections
+import functools
+import inspect
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import rrcf
 from vibe_analyzer import VibrationFeatures
 
+# fs を必要とする（スペクトル系の）特徴量関数名
+_FS_FUNCS = frozenset({'calc_spectral_centroid', 'calc_centroid'})
+
+# 特徴量・Shingle の計算精度（RRCFのカット判定に倍精度は不要）
+_DTYPE = np.float32
+# 標準化のゼロ除算対策
+_EPS = np.float32(1e-9)
+# 重複対策ノイズの大きさ（float32 の分解能で消えない程度）
+_NOISE_SCALE = np.float32(1e-5)
+
+
+def _make_calls(feat_plan, fs):
+    """
+    (位置, 関数, fsが必要か, spectrumを受け取れるか) の計画から、fs を束縛済みの呼び出しリストを作る
+
+    Returns:
+        (time_calls, spectral_calls): それぞれ (位置, 呼び出し可能オブジェクト) のリスト。
+        time_calls は data のみ、spectral_calls は data と spectrum を引数に取る
+        （fs が必要でも spectrum を受け取れない関数は time_calls 側で自前に計算させる）
+    """
+    time_calls = []
+    spectral_calls = []
+    for slot, f, needs_fs, takes_spectrum in feat_plan:
+        if not needs_fs:
+            time_calls.append((slot, f))
+        elif takes_spectrum:
+            spectral_calls.append((slot, functools.partial(f, fs=fs)))
+        else:
+            time_calls.append((slot, functools.partial(f, fs=fs)))
+    return time_calls, spectral_calls
+
+
+def _takes_spectrum(f):
+    """関数が spectrum キーワード引数を受け取れるか（FFT結果を使い回せるか）"""
+    try:
+        params = inspect.signature(f).parameters
+    except (TypeError, ValueError):
+        return False
+    return 'spectrum' in params or any(p.kind is p.VAR_KEYWORD for p in params.values())
+
+
+def _score_one_tree(tree, leaf_order, shingle, idx, tree_size):
+    """1本の木に点を挿入し、その点の CoDisp を返す（木ごとに独立なので並列実行可）"""
+    # tree_size 点貯まったら古い点から消していく
+    # leaf_order はこの木に挿入した順のインデックスなので、先頭が一番古い点
+    if len(leaf_order) >= tree_size:
+        tree.forget_point(leaf_order.popleft())
+
+    # 新しい点を挿入（インデックスを重複させないために今のカウントを使用）
+    tree.insert_point(shingle, index=idx)
+    leaf_order.append(idx)
+
+    # 異常度の計算 (CoDisp)
+    return tree.codisp(idx)
+
+
+def _score_trees(trees, leaf_orders, shingle, idx, tree_size):
+    """木の一部分（1スレッド分）をまとめて処理し、CoDisp のリストを返す"""
+    return [_score_one_tree(tree, leaf_order, shingle, idx, tree_size)
+            for tree, leaf_order in zip(trees, leaf_orders)]
+
+
 class AnomalyDetector:
     """RRCFを用いた振動異常検知ライブラリ"""
 
-    def __init__(self, feature_functions, shingle_size=10, num_trees=200, tree_size=1024):
+    def __init__(self, feature_functions, shingle_size=10, num_trees=200, tree_size=1024, n_jobs=1,
+                 threshold_sigma=3.0, threshold_refresh=10, score_window=6000):
         """
         Args:
             feature_functions: 使用する特徴量関数のリスト (例: [vf.calc_rms, vf.calc_kurtosis])
+                calc_spectral_centroid / calc_centroid は f(data, fs) として呼ぶ。
+                spectrum キーワード引数を受け取る関数にだけ、共有のFFT結果を spectrum= で渡す
             shingle_size: 過去何回分の特徴量を束ねるか
             num_trees: RRCFの木の数
             tree_size: 木に保持する最大データ点数
+            n_jobs: 木のスコア計算に使うスレッド数 (-1 で全コア、1 で逐次実行)
+            threshold_sigma: 異常判定しきい値 (平均 + threshold_sigma × 標準偏差) の倍数
+            threshold_refresh: しきい値を何スコアごとに更新するか
+            score_window: しきい値・統計量の計算対象にする直近のスコア数
         """
         self.feature_functions = feature_functions
         self.shingle_size = shingle_size
         self.num_features = len(feature_functions)
+
+        # 同じ特徴量関数が複数指定されていても計算は1回にまとめる
+        # _expand[i] は i 番目の特徴量が何番目のユニークな関数の値か（Shingleの次元数は変えない）
+        seen = {}
+        unique_functions = []
+        for f in feature_functions:
+            if f in seen:
+                warnings.warn(f"feature function '{f.__name__}' is specified more than once; "
+                              "it is computed once and its value is reused")
+            else:
+                seen[f] = len(unique_functions)
+                unique_functions.append(f)
+        self._expand = np.array([seen[f] for f in feature_functions], dtype=np.intp)
+        self._num_unique = len(unique_functions)
+
+        # 特徴量ごとの呼び出し方を事前に決めておく（毎回の関数名比較を避ける）
+        # 各要素は (ユニークな特徴量の中での位置, 関数, fsが必要か, spectrumを受け取れるか)
+        self._feat_plan = [(slot, f, f.__name__ in _FS_FUNCS, _takes_spectrum(f))
+                           for slot, f in enumerate(unique_functions)]
+
+        # RMS と尖度が両方ある場合は、1回の走査で両方求める融合カーネルにまとめる
+        names = [f.__name__ for f in unique_functions]
+        self._time_block = None
+        if 'calc_rms' in names and 'calc_kurtosis' in names:
+            self._time_block = (names.index('calc_rms'), names.index('calc_kurtosis'))
+            self._feat_plan = [p for p in self._feat_plan if p[0] not in self._time_block]
+            # JITコンパイルを初回メッセージの前に済ませておく
+            VibrationFeatures.calc_time_block(np.zeros(16, dtype=_DTYPE))
+
+        # fs を束縛した呼び出しリストは最初の get_score で（fs が変わった時だけ）作り直す
+        self._fs = None
+        self._time_calls, self._spectral_calls = _make_calls(self._feat_plan, None)
         
         # RRCFの初期化
         self.forest = [rrcf.RCTree() for _ in range(num_trees)]
         self.tree_size = tree_size
+        # 木ごとの挿入順（tree.leaves の並びに依存せず、最古の点を O(1) で取り出すため）
+        self._leaf_order = [collections.deque() for _ in range(num_trees)]
+
+        # 木ごとの挿入・スコア計算を並列化（RCTreeはpickleが重いのでスレッドで共有する）
+        # スレッドプールは検知器の生存期間中ずっと使い回す（メッセージごとに作り直さない）
+        self.n_jobs = n_jobs
+        n_workers = min(os.cpu_count() or 1, num_trees) if n_jobs == -1 else min(n_jobs, num_trees)
+        if n_workers < 1:
+            raise ValueError("n_jobs must be -1 or a positive integer")
+        self._executor = ThreadPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+        # 木をスレッド数で分割しておき、1スレッドあたり1タスクにまとめる
+        bounds = np.linspace(0, num_trees, n_workers + 1).astype(int)
+        self._partitions = [(self.forest[a:b], self._leaf_order[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
         
-        # Shingling用のバッファ（過去の特徴量ベクトルを保持）
-        self.shingle_buffer = []
+        # Shingling用のリングバッファ（過去の特徴量ベクトルを保持）
+        # list の append/pop(0) を避け、固定長の配列を書き込み位置だけ進めて使い回す
+        self._ring = np.empty((shingle_size, self.num_features), dtype=_DTYPE)
+        self._cursor = 0
+        self._filled = 0
         self.total_points = 0
 
+        # 重複対策ノイズ用のバッファ（毎回の配列確保を避ける）
+        self._rng = np.random.default_rng()
+        self._noise = np.empty(shingle_size * self.num_features, dtype=_DTYPE)
+
         # _rrcf.py の AnomalyDetector.__init__ に追加
         self.mean = None
         self.std = None
         self.alpha = 0.01 # 更新重み（適宜調整）
 
+        # 直近 score_window 個の異常スコアの統計量（0より大きいスコアのみ対象）
+        # 平均・分散は Welford の逐次更新で、窓から外れたスコアは逆向きの更新で取り除く
+        # 最小・最大は単調なdequeで管理し、どれも1スコアあたり O(1)（償却）で求める
+        if score_window < 1:
+            raise ValueError("score_window must be >= 1")
+        self.score_window = score_window
+        self._window_scores = collections.deque()
+        self._score_seq = 0
+        self._min_deque = collections.deque()   # (通し番号, スコア) をスコアの昇順に保持
+        self._max_deque = collections.deque()   # (通し番号, スコア) をスコアの降順に保持
+        self._score_count = 0
+        self._score_mean = 0.0
+        self._score_m2 = 0.0
+        self._score_min = np.inf
+        self._score_max = -np.inf
+
+        # 異常判定しきい値のキャッシュ（threshold_refresh スコアごとに統計量から更新）
+        if threshold_refresh < 1:
+            raise ValueError("threshold_refresh must be >= 1")
+        self.threshold_sigma = threshold_sigma
+        self.threshold_refresh = threshold_refresh
+        self._threshold_cache = None
+
     def get_score(self, time_series_data, fs):
         # 1. 特徴量抽出
-        features = []
-        for func in self.feature_functions:
-            # --- 修正ポイント ---
-            # 関数名を確認し、fsが必要な関数（スペクトル系）にはfsを渡す
-            if func.__name__ in ['calc_spectral_centroid', 'calc_centroid']:
-                val = func(time_series_data, fs=fs)
-            else:
-                val = func(time_series_data)
-            features.append(val)
+        if fs != self._fs:
+            self._time_calls, self._spectral_calls = _make_calls(self._feat_plan, fs)
+            self._fs = fs
+
+        features = np.empty(self._num_unique, dtype=_DTYPE)
+        if self._time_block is not None:
+            rms_slot, kurt_slot = self._time_block
+            features[rms_slot], features[kurt_slot] = VibrationFeatures.calc_time_block(time_series_data)
+        for slot, call in self._time_calls:
+            features[slot] = call(time_series_data)
+        if self._spectral_calls:
+            # スペクトル系の特徴量が複数あってもFFTは1回だけ計算して使い回す
+            spectrum = VibrationFeatures.calc_spectrum(time_series_data, fs)
+            for slot, call in self._spectral_calls:
+                features[slot] = call(time_series_data, spectrum=spectrum)
+        # 重複指定された特徴量を元の並びに展開
+        features = features[self._expand]
 
-        # get_score メソッド内、features計算直後に追加
-        features = np.array(features)
         if self.mean is None:
             self.mean = features
             self.std = np.ones_like(features)
@@ -53,40 +209,104 @@ class AnomalyDetector:
             self.std = (1 - self.alpha) * self.std + self.alpha * np.abs(features - self.mean)
 
         # 標準化 (z-score)
-        normalized_features = (features - self.mean) / (self.std + 1e-9)
-        self.shingle_buffer.append(normalized_features)
+        normalized_features = (features - self.mean) / (self.std + _EPS)
 
         # 2. Shingle（過去の履歴と結合）に変換
-        #self.shingle_buffer.append(features)
-        
-        # バッファサイズをshingle_sizeに保つ（古いデータを削除）
-        if len(self.shingle_buffer) > self.shingle_size:
-            self.shingle_buffer.pop(0)
+        # 最も古い行を上書きし、書き込み位置を1つ進める
+        self._ring[self._cursor] = normalized_features
+        self._cursor = (self._cursor + 1) % self.shingle_size
+        self._filled = min(self._filled + 1, self.shingle_size)
         
         # 履歴が貯まるまでは0を返す
-        if len(self.shingle_buffer) < self.shingle_size:
+        if self._filled < self.shingle_size:
             return 0.0
             
-        shingle = np.array(list(self.shingle_buffer)).flatten()
+        # 書き込み位置から先が古い順なので、古い→新しい順に並べて1次元化
+        shingle = np.concatenate((self._ring[self._cursor:], self._ring[:self._cursor])).ravel()
         
         # --- 重複エラー対策 & スコア計算 ---
         # わずかなノイズを加えて、RRCFが「同じ点だ！」と判定するのを防ぐ
-        shingle += np.random.normal(0, 1e-10, shingle.shape)
+        self._rng.standard_normal(dtype=_DTYPE, out=self._noise)
+        self._noise *= _NOISE_SCALE
+        shingle += self._noise
         
-        scores = []
-        for tree in self.forest:
-            # 100点（tree_size）貯まったら古い点から消していく
-            if len(tree.leaves) >= self.tree_size:
-                # 0番（一番古い点）を削除
-                # tree.leavesのキーから最小のものを消すのが確実
-                oldest_idx = min(tree.leaves.keys())
-                tree.forget_point(oldest_idx)
-            
-            # 新しい点を挿入（インデックスを重複させないために今のカウントを使用）
-            tree.insert_point(shingle, index=self.total_points)
-            
-            # 異常度の計算 (CoDisp)
-            scores.append(tree.codisp(self.total_points))
+        # 各木は独立しているので、木ごとに挿入→CoDisp計算を並列に行う
+        if self._executor is None:
+            scores = _score_trees(self.forest, self._leaf_order, shingle, self.total_points, self.tree_size)
+        else:
+            futures = [self._executor.submit(_score_trees, trees, leaf_orders, shingle,
+                                             self.total_points, self.tree_size)
+                       for trees, leaf_orders in self._partitions]
+            scores = [score for future in futures for score in future.result()]
         
         self.total_points += 1
-        return np.mean(scores)
\ No newline at end of file
+        score = np.mean(scores)
+        if score > 0.0:
+            self._update_score_stats(score)
+        return score
+
+    def close(self):
+        """スコア計算用のスレッドプールを終了する"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _update_score_stats(self, score):
+        """直近 score_window 個のスコアの統計量を1点分だけ逐次更新 (Welford)"""
+        # 窓から外れる一番古いスコアを取り除く
+        if len(self._window_scores) >= self.score_window:
+            old = self._window_scores.popleft()
+            self._score_count -= 1
+            if self._score_count == 0:
+                self._score_mean = 0.0
+                self._score_m2 = 0.0
+            else:
+                delta = old - self._score_mean
+                self._score_mean -= delta / self._score_count
+                self._score_m2 -= delta * (old - self._score_mean)
+            oldest_seq = self._score_seq - self.score_window
+            if self._min_deque[0][0] <= oldest_seq:
+                self._min_deque.popleft()
+            if self._max_deque[0][0] <= oldest_seq:
+                self._max_deque.popleft()
+
+        # 新しいスコアを加える
+        self._window_scores.append(score)
+        self._score_count += 1
+        delta = score - self._score_mean
+        self._score_mean += delta / self._score_count
+        self._score_m2 += delta * (score - self._score_mean)
+        while self._min_deque and self._min_deque[-1][1] >= score:
+            self._min_deque.pop()
+        self._min_deque.append((self._score_seq, score))
+        while self._max_deque and self._max_deque[-1][1] <= score:
+            self._max_deque.pop()
+        self._max_deque.append((self._score_seq, score))
+        self._score_seq += 1
+        # 描画スレッドからはこの値だけを読む
+        self._score_min = self._min_deque[0][1]
+        self._score_max = self._max_deque[0][1]
+
+        # しきい値は毎回ではなく threshold_refresh スコアごとに更新する
+        if self._threshold_cache is None or self._score_seq % self.threshold_refresh == 0:
+            # 取り除く更新の丸め誤差で M2 がわずかに負になることがあるので0で切る
+            std = np.sqrt(max(self._score_m2, 0.0) / self._score_count)
+            self._threshold_cache = self._score_mean + self.threshold_sigma * std
+
+    @property
+    def upper_threshold(self):
+        """異常判定しきい値 (平均 + threshold_sigma × 標準偏差)。まだスコアが無ければ None"""
+        return self._threshold_cache
+
+    def score_stats(self):
+        """
+        直近 score_window 個の異常スコア（0より大きいもの）の統計量
+
+        Returns:
+            (mean, std, min, max, count)。まだスコアが無ければ None
+        """
+        count = self._score_count
+        if count == 0:
+            return None
+        std = np.sqrt(max(self._score_m2, 0.0) / count)
+        return self._score_mean, std, self._score_min, self._score_max, count
\ No newline at end of file
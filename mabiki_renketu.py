@@ -1,71 +1,72 @@
 import numpy as np
 import os
-import csv
+import pandas as pd
+
+MAX_COLUMNS = 256  # 入力CSVの1行あたりの最大列数（これより列の多い行は読み込みエラーになる）
 
 def process_and_save_waveform(input_file, num_repeats=200):
     print(f"Reading {input_file}...")
     
-    raw_data = []
-    is_data_section = False
-    
     # --- 1. データ読み込み (1回分) ---
+    # ヘッダ部だけを行単位で走査し、データ区間の開始位置 (#EndHeader の次の行) を求める
+    skip_rows = None
     with open(input_file, mode='r', encoding='shift_jis') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not row: continue
-            tag = row[0].strip()
-            if tag == "#EndHeader":
-                is_data_section = True
-                continue
-            elif tag == "#BeginMark":
+        for line_no, line in enumerate(f):
+            if line.split(',', 1)[0].strip().strip('"') == "#EndHeader":
+                skip_rows = line_no + 1
                 break
-            if is_data_section:
-                try:
-                    raw_data.append(float(row[2]))
-                except (ValueError, IndexError):
-                    continue
 
-    if not raw_data:
+    if skip_rows is None:
+        print("Error: Could not find valid data.")
+        return
+
+    # #EndHeader 以降の1列目（タグ）と3列目（振動値）を C パーサで一括読み込み
+    # 列名を十分な数だけ明示しておくと、列数の少ない行（ラベル行など）も NaN 埋めで読める
+    df = pd.read_csv(input_file, encoding='shift_jis', skiprows=skip_rows, header=None,
+                     names=range(MAX_COLUMNS), usecols=[0, 2], dtype=str, engine='c')
+    # 最初の #BeginMark の行より前がデータ区間
+    tags = df[0].str.strip().str.strip('"').to_numpy()
+    marks = np.flatnonzero(tags == "#BeginMark")
+    end = marks[0] if marks.size else len(df)
+    # 数値にならない行は従来どおり読み飛ばす
+    raw_signal = pd.to_numeric(df[2].iloc[:end], errors='coerce').dropna().to_numpy(dtype=np.float32)
+
+    if raw_signal.size == 0:
         print("Error: Could not find valid data.")
         return
 
     # --- 2. 25kHzへのダウンサンプリング (50kHz -> 25kHz) ---
-    raw_signal = np.array(raw_data)
-    if len(raw_signal) % 2 != 0:
-        raw_signal = raw_signal[:-1]
-    resampled_single = (raw_signal[0::2] + raw_signal[1::2]) / 2
+    # 隣り合う2点の平均を、中間配列を作らずに出力先へ直接書き込む（奇数個なら最後の1点は捨てる）
+    n = raw_signal.size // 2
+    resampled_single = np.empty(n, dtype=raw_signal.dtype)
+    np.add(raw_signal[0:2*n:2], raw_signal[1:2*n:2], out=resampled_single)
+    resampled_single *= 0.5
     
-    single_len = len(resampled_single)
     dt = 1.0 / 25000  # 0.00004秒
 
-    # --- 3. 追記モードで保存 ---
+    single_len = len(resampled_single)
+
+    # --- 3. 1回分ずつ保存 ---
     output_filename = "../new_waveform_25khz.csv"
     output_path = os.path.join(os.path.dirname(os.path.abspath(input_file)), output_filename)
-    
-    # 既存ファイルを削除してから開始
-    if os.path.exists(output_path):
-        os.remove(output_path)
 
     print(f"Starting incremental save to {output_filename}...")
     
     current_total_samples = 0
+    # 1回分の時間軸（各ブロックでは開始時刻を足すだけ）
+    block_times = np.arange(single_len, dtype=np.float64) * dt
     
-    # 1200回繰り返しながら、その都度ファイルに書き込む
+    # 全繰り返し分をメモリに載せると巨大になるので、1回分ずつ同じファイルに書き込む
     # ※クロスフェードは今回は簡易化のため省略し、単純連結します。
     # (高周波サンプリングでは単純連結でもスコアへの影響は限定的です)
-    with open(output_path, mode='a', newline='') as f_out:
-        writer = csv.writer(f_out)
-        
+    with open(output_path, mode='w', newline='') as f_out:
         for i in range(num_repeats):
             if i % 100 == 0:
                 print(f"Processing... {i}/{num_repeats}")
             
-            # このブロック用の時間軸を作成
-            times = (np.arange(single_len) + current_total_samples) * dt
-            
-            # [時間, 振動値] のペアをリストにして一括書き込み
-            chunk = np.column_stack((times, resampled_single))
-            writer.writerows(chunk)
+            # [時間, 振動値] の2列を書き出す（振動値は float32 の有効桁数で出力）
+            times = block_times + current_total_samples * dt
+            np.savetxt(f_out, np.column_stack((times, resampled_single)), fmt=('%.10g', '%.7g'), delimiter=',')
             
             current_total_samples += single_len
 
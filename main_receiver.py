@@ -1,14 +1,19 @@
 import paho.mqtt.client as mqtt
-import json
+import struct
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
+from matplotlib.collections import LineCollection
 from _rrcf import AnomalyDetector, VibrationFeatures
 import traceback
 import time
+import queue
+import threading
 
 # --- 設定 ---
 FS = 25000
+CHUNK_SIZE = 2500           # 1メッセージ (0.1秒) あたりのサンプル数
+CHUNK_OFFSETS = np.arange(CHUNK_SIZE) / FS  # チャンク内の各サンプルの開始時刻からの経過時間
 TOPIC = "vibration/data"
 BROKER = "localhost"
 UPDATE_INTERVAL_MS = 5000  # グラフ更新間隔 (5秒 = 5000ms)
@@ -16,6 +21,8 @@ MAX_PLOT_POINTS = 6000      # グラフに表示する最大データ点数（
 TIME_MARGIN_RATIO = 0.05    # 時間軸の右側余裕 (5%)
 WARMUP_TIME = 30.0          # 慣らし時間 (30秒)
 ANOMALY_THRESHOLD = 3.0     # 異常判定の標準偏差倍数
+HEADER_SIZE = 8             # ペイロードのヘッダ長 (チャンク数, チャンク長: uint32 x2)
+QUEUE_MAXSIZE = 100         # 受信チャンクの待ち行列の上限 (10秒分)。溢れたら古いものから捨てる
 
 # 表示モード設定
 DISPLAY_MODE = "scroll"  # "full" or "scroll"
@@ -26,18 +33,34 @@ vf = VibrationFeatures()
 detector = AnomalyDetector(
     feature_functions=[vf.calc_rms, vf.calc_spectral_centroid,vf.calc_spectral_centroid],
     shingle_size=10,
-    tree_size=100
+    tree_size=100,
+    threshold_sigma=ANOMALY_THRESHOLD,
+    score_window=MAX_PLOT_POINTS
 )
 
 # --- データ保持用バッファ ---
-score_history = []
-time_history = []
-waveform_data_all = []  # 全波形データを保存（2500点ごとのチャンクを連結）
-anomaly_flags = []      # 異常フラグ保存用（0.1秒ごと）
+# スコア・時刻・異常フラグの履歴（MAX_PLOT_POINTS 件のリングバッファ、3つとも同じ位置に書く）
+score_ring = np.zeros(MAX_PLOT_POINTS, dtype=np.float64)
+time_ring = np.zeros(MAX_PLOT_POINTS, dtype=np.float64)
+flag_ring = np.zeros(MAX_PLOT_POINTS, dtype=np.bool_)  # 異常フラグ保存用（0.1秒ごと）
+hist_cursor = 0   # 次に書き込む位置
+hist_filled = 0   # 格納済みの件数
+# 波形と履歴のリングバッファを1チャンク単位でそろえて読み書きするためのロック
+buffer_lock = threading.Lock()
+# 全波形データを保存するリングバッファ（2500点ごとのチャンクを連結、MAX_PLOT_POINTS チャンク分）
+WAVE_CAP = MAX_PLOT_POINTS * CHUNK_SIZE
+waveform_ring = np.empty(WAVE_CAP, dtype=np.float32)
+wave_cursor = 0   # 次に書き込む位置
+wave_filled = 0   # 格納済みのサンプル数
 current_time = 0
 last_update_time = 0
 message_count = 0
 is_connected = False
+dropped_chunks = 0
+enqueued_chunks = 0   # 受信したチャンクの通し番号（捨てたチャンクの分だけ時刻を進めるため）
+
+# 受信スレッドとスコア計算を切り離すための待ち行列
+chunk_queue = queue.Queue(maxsize=QUEUE_MAXSIZE)
 
 def on_connect(client, userdata, flags, rc):
     """MQTTブローカーに接続した時のコールバック"""
@@ -63,70 +86,152 @@ def on_disconnect(client, userdata, rc):
         print("✓ Disconnected normally")
 
 def on_message(client, userdata, msg):
+    """受信したチャンクを待ち行列に積むだけにして、MQTTの受信スレッドを止めない"""
+    try:
+        # ヘッダ (チャンク数, チャンク長) の後ろに little-endian float32 の波形がそのまま並んでいる
+        num_chunks, chunk_len = struct.unpack_from('<II', msg.payload)
+        if chunk_len != CHUNK_SIZE:
+            # 波形バッファや描画は CHUNK_SIZE 点/チャンクを前提にしているので受け付けない
+            print(f"⚠ Ignoring payload with chunk length {chunk_len} (expected {CHUNK_SIZE})")
+            return
+        chunks = np.frombuffer(msg.payload, dtype='<f4', count=num_chunks * chunk_len,
+                               offset=HEADER_SIZE).reshape(num_chunks, chunk_len)
+        for waveform_chunk in chunks:
+            enqueue_chunk(waveform_chunk)
+    except Exception as e:
+        print(f"✗ Error in on_message: {e}")
+        traceback.print_exc()
+
+def enqueue_chunk(waveform_chunk):
+    """待ち行列が一杯なら一番古いチャンクを捨ててから積む（計算が追いつかない時のバックプレッシャー）"""
+    global dropped_chunks, enqueued_chunks
+    seq = enqueued_chunks
+    enqueued_chunks += 1
+    while True:
+        try:
+            chunk_queue.put_nowait((seq, waveform_chunk))
+            return
+        except queue.Full:
+            try:
+                chunk_queue.get_nowait()
+                dropped_chunks += 1
+            except queue.Empty:
+                pass
+
+def scoring_worker():
+    """待ち行列からチャンクを取り出してスコア計算するワーカースレッド"""
+    global current_time
+    expected_seq = 0
+    while True:
+        seq, waveform_chunk = chunk_queue.get()
+        # 捨てられたチャンクがあれば、その分 (0.1秒 × 個数) 時刻を進めて時間軸の隙間として残す
+        if seq > expected_seq:
+            current_time += 0.1 * (seq - expected_seq)
+        expected_seq = seq + 1
+        process_chunk(waveform_chunk)
+
+def store_waveform(waveform_chunk):
+    """波形チャンクをリングバッファに書き込む（満杯なら一番古いデータを上書き）"""
+    global wave_cursor, wave_filled
+    n = len(waveform_chunk)
+    end = wave_cursor + n
+    if end <= WAVE_CAP:
+        waveform_ring[wave_cursor:end] = waveform_chunk
+    else:
+        # 末尾で折り返す分は先頭に書き込む
+        head = WAVE_CAP - wave_cursor
+        waveform_ring[wave_cursor:] = waveform_chunk[:head]
+        waveform_ring[:n - head] = waveform_chunk[head:]
+    wave_cursor = end % WAVE_CAP
+    wave_filled = min(wave_filled + n, WAVE_CAP)
+
+def get_waveform():
+    """リングバッファの中身を古い順に並べた配列を返す（描画時のみ呼ぶ）"""
+    if wave_filled < WAVE_CAP:
+        # ロックを外した後に上書きされないようコピーを返す
+        return waveform_ring[:wave_filled].copy()
+    return np.concatenate((waveform_ring[wave_cursor:], waveform_ring[:wave_cursor]))
+
+def store_history(score, t, is_anomaly):
+    """スコア履歴をリングバッファに書き込む（満杯なら一番古いものを上書き）"""
+    global hist_cursor, hist_filled
+    score_ring[hist_cursor] = score
+    time_ring[hist_cursor] = t
+    flag_ring[hist_cursor] = is_anomaly
+    hist_cursor = (hist_cursor + 1) % MAX_PLOT_POINTS
+    hist_filled = min(hist_filled + 1, MAX_PLOT_POINTS)
+
+def get_history():
+    """(時刻, スコア, 異常フラグ) の履歴を古い順に並べて返す"""
+    cursor, filled = hist_cursor, hist_filled
+    if filled < MAX_PLOT_POINTS:
+        # ロックを外した後に上書きされないようコピーを返す
+        return time_ring[:filled].copy(), score_ring[:filled].copy(), flag_ring[:filled].copy()
+    order = np.r_[cursor:MAX_PLOT_POINTS, 0:cursor]
+    return time_ring[order], score_ring[order], flag_ring[order]
+
+def process_chunk(waveform_chunk):
     global current_time, message_count, last_update_time
     
     try:
-        payload = json.loads(msg.payload)
-        waveform_chunk = np.array(payload["data"])
+        # 異常判定のしきい値は今回のスコアを含めない（スコア計算前に取得）
+        upper_threshold = detector.upper_threshold
         
         # スコア計算 (0.1s分のデータから1つのスコア)
         score = detector.get_score(waveform_chunk, fs=FS)
         
-        # 生の波形データを保存
-        waveform_data_all.extend(waveform_chunk.tolist())
-        
         # 異常判定（30秒経過後のみ）
         is_anomaly = False
-        if current_time >= WARMUP_TIME and len(score_history) > 0:
-            valid_scores = [s for s in score_history if s > 0.0]
-            if len(valid_scores) > 0:
-                mean_score = np.mean(valid_scores)
-                std_score = np.std(valid_scores)
-                upper_threshold = mean_score + ANOMALY_THRESHOLD * std_score
-                # 上限を超えた場合に異常と判定
-                if score > upper_threshold:
-                    is_anomaly = True
+        if current_time >= WARMUP_TIME and upper_threshold is not None:
+            # 上限を超えた場合に異常と判定
+            is_anomaly = bool(score > upper_threshold)
         
         message_count += 1
         
         # 10メッセージごとに詳細ログ、それ以外は簡易ログ
         anomaly_mark = " ⚠ ANOMALY!" if is_anomaly else ""
         if message_count % 10 == 0:
-            print(f"[MSG #{message_count}] Time: {current_time:.1f}s, Score: {score:.4f}, Buffer: {len(score_history)}{anomaly_mark}")
+            print(f"[MSG #{message_count}] Time: {current_time:.1f}s, Score: {score:.4f}, Buffer: {hist_filled}{anomaly_mark}")
         else:
             print(f"Time: {current_time:.1f}s, Score: {score:.4f}{anomaly_mark}")
         
-        # データをバッファに保存
-        score_history.append(score)
-        time_history.append(current_time)
-        anomaly_flags.append(is_anomaly)
+        # 生の波形データとスコア履歴をバッファに保存
+        # リングバッファなので、MAX_PLOT_POINTS を超えた古いデータ（波形も含む）は自動的に上書きされる
+        # 描画スレッドが片方だけ更新された状態を読まないよう、両方まとめてロック内で書く
+        with buffer_lock:
+            store_waveform(waveform_chunk)
+            store_history(score, current_time, is_anomaly)
         current_time += 0.1  # 送信側が0.1sおきなので
         last_update_time = current_time
-        
-        # メモリ節約のため古いデータを捨てる
-        if len(score_history) > MAX_PLOT_POINTS:
-            score_history.pop(0)
-            time_history.pop(0)
-            anomaly_flags.pop(0)
-            # 波形データも古い0.1秒分（2500点）を削除
-            waveform_data_all[:2500] = []
             
     except Exception as e:
-        print(f"✗ Error in on_message: {e}")
+        print(f"✗ Error in process_chunk: {e}")
         traceback.print_exc()
 
 # --- グラフ設定（上下2段） ---
 fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10), sharex=True)
 
-# 上段：波形データ（RMS）
-line1, = ax1.plot([], [], 'b-', lw=1, label='Waveform RMS')
-ax1.set_title("Waveform Data (RMS per 0.1s chunk)", fontsize=14, fontweight='bold')
-ax1.set_ylabel("RMS Amplitude", fontsize=12)
+# 上段：生波形（0.1秒チャンクごとに正常=青 / 異常=赤で色分け）
+# 毎フレーム描き直さず、LineCollection の線分だけを差し替える
+wave_normal_lc = LineCollection([], colors='b', lw=0.5, alpha=0.6)
+wave_anomaly_lc = LineCollection([], colors='r', lw=0.5, alpha=0.8)
+ax1.add_collection(wave_normal_lc)
+ax1.add_collection(wave_anomaly_lc)
+ax1.set_title("Waveform Data (25kHz Raw Signal)", fontsize=14, fontweight='bold')
+ax1.set_ylabel("Amplitude", fontsize=12)
 ax1.grid(True, alpha=0.3)
+# 凡例用のダミープロット
+ax1.plot([], [], 'b-', lw=2, label='Normal', alpha=0.6)
+ax1.plot([], [], 'r-', lw=2, label='Anomaly', alpha=0.8)
 ax1.legend()
 
-# 下段：異常スコア
-line2, = ax2.plot([], [], 'r-', lw=2, label='Anomaly Score')
+# 下段：異常スコア（線分は色ごとに1つの LineCollection、点はマーカーのみの Line2D）
+score_normal_lc = LineCollection([], colors='b', lw=2, alpha=0.6)
+score_anomaly_lc = LineCollection([], colors='r', lw=2, alpha=0.8)
+ax2.add_collection(score_normal_lc)
+ax2.add_collection(score_anomaly_lc)
+score_normal_pts, = ax2.plot([], [], 'bo', markersize=3, label='Normal', alpha=0.6)
+score_anomaly_pts, = ax2.plot([], [], 'ro', markersize=5, label='Anomaly', alpha=0.8)
 ax2.set_title("Real-time Anomaly Score (25kHz Vibration Analysis)", fontsize=14, fontweight='bold')
 ax2.set_xlabel("Time (s)", fontsize=12)
 ax2.set_ylabel("Anomaly Score", fontsize=12)
@@ -145,16 +250,24 @@ debug_text = ax2.text(0.98, 0.98, '', transform=ax2.transAxes,
                      bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.7),
                      fontsize=9, fontfamily='monospace')
 
+# 毎フレーム更新するアーティスト（作り直さずに使い回す）
+plot_artists = (wave_normal_lc, wave_anomaly_lc, score_normal_lc, score_anomaly_lc,
+                score_normal_pts, score_anomaly_pts, stats_text, debug_text)
+
 def init_plot():
     ax1.set_xlim(0, 10)
     ax1.set_ylim(0, 1)
     ax2.set_xlim(0, 10)
     ax2.set_ylim(0, 15)
-    line1.set_data([], [])
-    line2.set_data([], [])
+    wave_normal_lc.set_segments([])
+    wave_anomaly_lc.set_segments([])
+    score_normal_lc.set_segments([])
+    score_anomaly_lc.set_segments([])
+    score_normal_pts.set_data([], [])
+    score_anomaly_pts.set_data([], [])
     stats_text.set_text('')
     debug_text.set_text('')
-    return line1, line2, stats_text, debug_text
+    return plot_artists
 
 # グラフ更新カウンター
 plot_update_count = 0
@@ -165,170 +278,120 @@ def update_plot(frame):
     
     try:
         if plot_update_count % 10 == 0:
-            print(f"\n[PLOT UPDATE #{plot_update_count}] Frame: {frame}, Data points: {len(score_history)}")
+            print(f"\n[PLOT UPDATE #{plot_update_count}] Frame: {frame}, Data points: {hist_filled}")
         
-        if not time_history:
+        if hist_filled == 0:
             connection_status = "🟢 Connected" if is_connected else "🔴 Disconnected"
             debug_text.set_text(f'Waiting for data...\n{connection_status}')
-            return line1, line2, stats_text, debug_text
+            return plot_artists
+        
+        # 履歴を古い順の配列として取り出す（以降はすべてマスクによるベクトル演算）
+        # 波形も同じロック内で取り出し、チャンクと履歴の対応がずれないようにする
+        with buffer_lock:
+            times, scores, flags = get_history()
+            waveform_array = get_waveform()
+        latest_time = times[-1]
         
         # 表示範囲の計算
         if DISPLAY_MODE == "scroll":
             # スクロールモード：最新60秒を表示
-            latest_time = time_history[-1]
             x_min = max(0, latest_time - SCROLL_WINDOW)
             x_max = latest_time + SCROLL_WINDOW * 0.02  # 少し余裕を持たせる
         else:
             # フルモード：全データを表示
-            latest_time = time_history[-1]
             x_min = 0
             x_max = latest_time * (1 + TIME_MARGIN_RATIO)
             x_max = max(x_max, 10)
         
         # 上段グラフ（生波形）を更新
-        ax1.clear()
-        ax1.set_ylabel("Amplitude", fontsize=12)
-        ax1.set_title("Waveform Data (25kHz Raw Signal)", fontsize=14, fontweight='bold')
-        ax1.grid(True, alpha=0.3)
+        # 波形のチャンクと履歴は1対1に対応する
+        n_chunks = min(len(waveform_array) // CHUNK_SIZE, len(times))
+        chunk_data = waveform_array[:n_chunks * CHUNK_SIZE].reshape(n_chunks, CHUNK_SIZE)
+        chunk_start = times[:n_chunks]
+        chunk_flags = flags[:n_chunks]
         
-        if len(waveform_data_all) > 0:
-            waveform_array = np.array(waveform_data_all)
-            
-            # 異常フラグに基づいて色分け
-            # 各チャンクは2500点なので、各0.1秒区間ごとに色を変える
-            for i, is_anomaly in enumerate(anomaly_flags):
-                start_idx = i * 2500
-                end_idx = min(start_idx + 2500, len(waveform_array))
-                
-                if start_idx < len(waveform_array) and end_idx > start_idx:
-                    # この区間の時間軸を作成（開始時刻 + サンプル番号/サンプリング周波数）
-                    start_time = i * 0.1  # 各チャンクは0.1秒
-                    segment_length = end_idx - start_idx
-                    segment_time = start_time + np.arange(segment_length) / FS
-                    segment_data = waveform_array[start_idx:end_idx]
-                    
-                    # 表示範囲内のデータのみプロット
-                    if segment_time[-1] >= x_min and segment_time[0] <= x_max:
-                        if is_anomaly:
-                            ax1.plot(segment_time, segment_data, 'r-', lw=0.5, alpha=0.8)
-                        else:
-                            ax1.plot(segment_time, segment_data, 'b-', lw=0.5, alpha=0.6)
-            
-            # 凡例用のダミープロット
-            ax1.plot([], [], 'b-', lw=2, label='Normal', alpha=0.6)
-            ax1.plot([], [], 'r-', lw=2, label='Anomaly', alpha=0.8)
-            ax1.legend()
+        # 表示範囲にかかるチャンクだけを (チャンク数, CHUNK_SIZE, 2) の線分配列にする
+        visible = (chunk_start + CHUNK_OFFSETS[-1] >= x_min) & (chunk_start <= x_max)
+        visible_data = chunk_data[visible]
+        visible_flags = chunk_flags[visible]
+        segment_time = chunk_start[visible, None] + CHUNK_OFFSETS
+        wave_segments = np.stack((segment_time, visible_data), axis=-1)
         
-        # 下段グラフ（異常スコア）を更新
-        ax2.clear()
-        ax2.set_xlabel("Time (s)", fontsize=12)
-        ax2.set_ylabel("Anomaly Score", fontsize=12)
-        ax2.set_title("Real-time Anomaly Score (25kHz Vibration Analysis)", fontsize=14, fontweight='bold')
-        ax2.grid(True, alpha=0.3)
+        # 異常フラグに基づいて色分け（0.1秒区間ごと）
+        wave_normal_lc.set_segments(wave_segments[~visible_flags])
+        wave_anomaly_lc.set_segments(wave_segments[visible_flags])
         
+        # 下段グラフ（異常スコア）を更新
         # スコアも色分けして表示（表示範囲内のみ）
-        for i in range(len(time_history)):
-            if i > 0 and time_history[i] >= x_min and time_history[i-1] <= x_max:
-                # 線分を描画
-                if anomaly_flags[i] or anomaly_flags[i-1]:
-                    ax2.plot([time_history[i-1], time_history[i]], 
-                            [score_history[i-1], score_history[i]], 
-                            'r-', lw=2, alpha=0.8)
-                else:
-                    ax2.plot([time_history[i-1], time_history[i]], 
-                            [score_history[i-1], score_history[i]], 
-                            'b-', lw=2, alpha=0.6)
+        # 隣り合う2点を結ぶ線分を (点数-1, 2, 2) の配列としてまとめて作る
+        points = np.column_stack((times, scores))
+        score_segments = np.stack((points[:-1], points[1:]), axis=1)
+        visible_segments = (times[1:] >= x_min) & (times[:-1] <= x_max)
+        anomaly_segments = flags[1:] | flags[:-1]
+        score_normal_lc.set_segments(score_segments[visible_segments & ~anomaly_segments])
+        score_anomaly_lc.set_segments(score_segments[visible_segments & anomaly_segments])
         
         # ポイントマーカーを追加（表示範囲内のみ）
-        normal_times = [time_history[i] for i in range(len(time_history)) 
-                       if not anomaly_flags[i] and x_min <= time_history[i] <= x_max]
-        normal_scores = [score_history[i] for i in range(len(score_history)) 
-                        if not anomaly_flags[i] and x_min <= time_history[i] <= x_max]
-        anomaly_times = [time_history[i] for i in range(len(time_history)) 
-                        if anomaly_flags[i] and x_min <= time_history[i] <= x_max]
-        anomaly_scores = [score_history[i] for i in range(len(score_history)) 
-                         if anomaly_flags[i] and x_min <= time_history[i] <= x_max]
+        in_view = (times >= x_min) & (times <= x_max)
+        normal_points = in_view & ~flags
+        anomaly_points = in_view & flags
         
-        if normal_times:
-            ax2.plot(normal_times, normal_scores, 'bo', markersize=3, label='Normal', alpha=0.6)
-        if anomaly_times:
-            ax2.plot(anomaly_times, anomaly_scores, 'ro', markersize=5, label='Anomaly', alpha=0.8)
-        
-        ax2.legend()
+        score_normal_pts.set_data(times[normal_points], scores[normal_points])
+        score_anomaly_pts.set_data(times[anomaly_points], scores[anomaly_points])
         
         # 横軸の範囲を設定
         ax1.set_xlim(x_min, x_max)
         ax2.set_xlim(x_min, x_max)
         
         # 上段の縦軸の範囲を自動調整（表示範囲内のデータのみ考慮）
-        if len(waveform_data_all) > 0:
-            waveform_array = np.array(waveform_data_all)
-            # 表示範囲内のデータを抽出
-            visible_indices = []
-            for i in range(len(anomaly_flags)):
-                start_time = i * 0.1
-                end_time = start_time + 0.1
-                if start_time <= x_max and end_time >= x_min:
-                    start_idx = i * 2500
-                    end_idx = min(start_idx + 2500, len(waveform_array))
-                    visible_indices.extend(range(start_idx, end_idx))
-            
-            if visible_indices:
-                visible_data = waveform_array[visible_indices]
-                max_w = np.max(visible_data)
-                min_w = np.min(visible_data)
-                margin = (max_w - min_w) * 0.1
-                ax1.set_ylim(min_w - margin, max_w + margin)
+        if visible_data.size > 0:
+            max_w = np.max(visible_data)
+            min_w = np.min(visible_data)
+            margin = (max_w - min_w) * 0.1
+            ax1.set_ylim(min_w - margin, max_w + margin)
         
         # 下段の縦軸の範囲を自動調整（表示範囲内のデータのみ考慮）
-        visible_scores = [score_history[i] for i in range(len(score_history)) 
-                         if x_min <= time_history[i] <= x_max]
-        if visible_scores:
-            max_s = max(visible_scores)
-            min_s = min(visible_scores)
+        visible_scores = scores[in_view]
+        if visible_scores.size > 0:
+            max_s = np.max(visible_scores)
+            min_s = np.min(visible_scores)
             if max_s > 0:
                 ax2.set_ylim(min(0, min_s * 0.9), max_s * 1.2)
             else:
                 ax2.set_ylim(0, 15)
         
-        # 統計情報の計算と表示更新（全データに基づく）
-        if len(score_history) > 0:
-            valid_scores = [s for s in score_history if s > 0.0]
+        # 統計情報の計算と表示更新（直近 MAX_PLOT_POINTS 件に基づく）
+        # 統計量は検知器が逐次更新しているので、ここでは読み出すだけ
+        if hist_filled > 0:
+            stats = detector.score_stats()
             
-            if len(valid_scores) > 0:
-                mean_score = np.mean(valid_scores)
-                std_score = np.std(valid_scores)
-                min_score = np.min(valid_scores)
-                max_score = np.max(valid_scores)
-                upper_threshold = mean_score + ANOMALY_THRESHOLD * std_score
-                anomaly_count = sum(anomaly_flags)
+            if stats is not None:
+                mean_score, std_score, min_score, max_score, n_scores = stats
+                upper_threshold = detector.upper_threshold
+                anomaly_count = np.count_nonzero(flags)
                 
-                stats_info = f'Mean:       {mean_score:.4f}\nStd:        {std_score:.4f}\nMin:        {min_score:.4f}\nMax:        {max_score:.4f}\nThreshold:  {upper_threshold:.4f}\nAnomalies:  {anomaly_count}\nN:          {len(valid_scores)}'
+                stats_info = f'Mean:       {mean_score:.4f}\nStd:        {std_score:.4f}\nMin:        {min_score:.4f}\nMax:        {max_score:.4f}\nThreshold:  {upper_threshold:.4f}\nAnomalies:  {anomaly_count}\nN:          {n_scores}'
             else:
                 stats_info = 'Waiting for data...'
             
             stats_text.set_text(stats_info)
-            stats_text.set_position((0.02, 0.02))
-            stats_text.set_transform(ax2.transAxes)
         
         # デバッグ情報の更新（接続状態を含む）
         connection_status = "🟢" if is_connected else "🔴"
         warmup_status = "⏱ Warmup" if current_time < WARMUP_TIME else "✓ Active"
         mode_info = f"Mode: {DISPLAY_MODE.upper()}"
-        debug_info = f'{connection_status} Update: #{plot_update_count}\nMsgs:   {message_count}\nLast:   {last_update_time:.1f}s\nBuffer: {len(score_history)}\nWave:   {len(waveform_data_all)} pts\n{warmup_status}\n{mode_info}'
+        debug_info = f'{connection_status} Update: #{plot_update_count}\nMsgs:   {message_count}\nLast:   {last_update_time:.1f}s\nBuffer: {hist_filled}\nWave:   {wave_filled} pts\nQueue:  {chunk_queue.qsize()} (drop {dropped_chunks})\n{warmup_status}\n{mode_info}'
         debug_text.set_text(debug_info)
-        debug_text.set_position((0.98, 0.98))
-        debug_text.set_transform(ax2.transAxes)
         
         # 軸の範囲を変更したので再描画
         fig.canvas.draw()
         
-        return line1, line2, stats_text, debug_text
+        return plot_artists
         
     except Exception as e:
         print(f"✗ Error in update_plot: {e}")
         traceback.print_exc()
-        return line1, line2, stats_text, debug_text
+        return plot_artists
 
 # --- メイン処理 ---
 def start_receiver():
@@ -346,6 +409,9 @@ def start_receiver():
         print(f"⟳ Connecting to MQTT broker at {BROKER}:1883...")
         client.connect(BROKER, 1883, 60)
         
+        # スコア計算用のワーカースレッドを開始
+        threading.Thread(target=scoring_worker, daemon=True).start()
+        
         # MQTTの受信ループを別スレッドで開始（自動再接続が有効）
         client.loop_start()
         print("✓ MQTT loop started (auto-reconnect enabled)")
@@ -370,6 +436,7 @@ def start_receiver():
             print(f"  Display mode: FULL (0 to current_time × {1 + TIME_MARGIN_RATIO})")
         print(f"  Warmup time: {WARMUP_TIME}s")
         print(f"  Anomaly threshold: Mean + {ANOMALY_THRESHOLD}σ")
+        print(f"  Receive queue size: {QUEUE_MAXSIZE} chunks (drop-oldest)")
         print(f"{'='*50}\n")
         
         ani = FuncAnimation(fig, update_plot, init_func=init_plot, 
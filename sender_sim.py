@@ -2,13 +2,24 @@ import pandas as pd
 import numpy as np
 import paho.mqtt.client as mqtt
 import time
-import json
+import struct
 
 # 設定
 CSV_FILE = "../new_waveform_25khz.csv"
 TOPIC = "vibration/data"
 BROKER = "localhost" # ラズパイとPCが別ならPCのIPアドレス
 WINDOW_SIZE = 2500  # 0.1秒分 (25kHz)
+BATCH_N = 1         # 1メッセージにまとめるチャンク数 (1ならバッチしない)
+MAX_DURATION = 1.0  # バッチを溜める最大時間 [秒]（BATCH_N に達しなくてもこの時間で送る）
+
+def publish_batch(client, batch):
+    """
+    チャンクのリストを1つのMQTTメッセージとして送信
+    形式: ヘッダ (チャンク数, チャンク長: little-endian uint32 x2) + float32 の生バイト列
+    """
+    header = struct.pack('<II', len(batch), WINDOW_SIZE)
+    payload = header + np.asarray(batch, dtype='<f4').tobytes()
+    client.publish(TOPIC, payload)
 
 def start_sender():
     # データの読み込み（メモリ節約のためchunk読み推奨ですが、まずは全読み）
@@ -22,16 +33,21 @@ def start_sender():
     print("Start sending data...")
     num_chunks = len(vibration_data) // WINDOW_SIZE
     
+    batch = []
+    batch_start = time.time()
     for i in range(num_chunks):
         start_idx = i * WINDOW_SIZE
         end_idx = start_idx + WINDOW_SIZE
-        chunk = vibration_data[start_idx:end_idx].tolist()
+        batch.append(vibration_data[start_idx:end_idx])
         
-        # JSON形式でパブリッシュ
-        payload = json.dumps({"data": chunk})
-        client.publish(TOPIC, payload)
+        # BATCH_N 個溜まるか MAX_DURATION 経過したらまとめてパブリッシュ
+        is_last = (i == num_chunks - 1)
+        if len(batch) >= BATCH_N or time.time() - batch_start >= MAX_DURATION or is_last:
+            publish_batch(client, batch)
+            print(f"Sent chunk {i+1}/{num_chunks} ({len(batch)} chunk(s) in message)")
+            batch = []
+            batch_start = time.time()
         
-        print(f"Sent chunk {i+1}/{num_chunks}")
         time.sleep(0.1)  # 0.1秒待機（ここがリアルタイムの鍵）
 
     client.disconnect()
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("rrcf")
+
+from _rrcf import AnomalyDetector
+from vibe_analyzer import VibrationFeatures
+
+FS = 25000
+CHUNK_SIZE = 2500
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_get_score_past_warmup(n_jobs):
+    """Shingle が埋まり、木から点が削除され始めた後もスコアが出ること"""
+    vf = VibrationFeatures()
+    shingle_size = 4
+    tree_size = 8
+    detector = AnomalyDetector(
+        feature_functions=[vf.calc_rms, vf.calc_kurtosis, vf.calc_spectral_centroid],
+        shingle_size=shingle_size,
+        num_trees=5,
+        tree_size=tree_size,
+        n_jobs=n_jobs,
+    )
+    rng = np.random.default_rng(0)
+    scores = []
+    for _ in range(shingle_size + tree_size + 5):
+        chunk = rng.standard_normal(CHUNK_SIZE).astype(np.float32)
+        scores.append(detector.get_score(chunk, fs=FS))
+    detector.close()
+
+    # 履歴が貯まるまでは0
+    assert scores[:shingle_size - 1] == [0.0] * (shingle_size - 1)
+    # それ以降は正の有限値
+    later = np.array(scores[shingle_size - 1:])
+    assert np.all(np.isfinite(later)) and np.all(later > 0.0)
+    assert all(len(order) == tree_size for order in detector._leaf_order)
+    assert detector.score_stats() is not None
+    assert detector.upper_threshold is not None
+
+
+@pytest.mark.parametrize("kwargs", [{"score_window": 0}, {"threshold_refresh": 0}])
+def test_rejects_non_positive_window_params(kwargs):
+    vf = VibrationFeatures()
+    with pytest.raises(ValueError):
+        AnomalyDetector(feature_functions=[vf.calc_rms], **kwargs)
+
+
+def test_fs_function_without_spectrum_kwarg():
+    """spectrum を受け取らない calc_centroid(data, fs) もそのまま使えること"""
+    vf = VibrationFeatures()
+
+    def calc_centroid(data, fs):
+        return vf.calc_spectral_centroid(data, fs)
+
+    detector = AnomalyDetector(
+        feature_functions=[calc_centroid, vf.calc_spectral_centroid],
+        shingle_size=2,
+        num_trees=3,
+        tree_size=4,
+    )
+    rng = np.random.default_rng(1)
+    for _ in range(4):
+        score = detector.get_score(rng.standard_normal(CHUNK_SIZE).astype(np.float32), fs=FS)
+    detector.close()
+    assert np.isfinite(score)
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from vibe_analyzer import VibrationFeatures
+
+
+def test_time_block_matches_reference_with_offset():
+    """直流成分の大きい信号（桁落ちしやすいケース）でも calc_rms / scipy と一致すること"""
+    rng = np.random.default_rng(0)
+    offset = (30000.0 + rng.standard_normal(2500)).astype(np.float32)
+    ref = offset.astype(np.float64)
+    rms, kurtosis = VibrationFeatures.calc_time_block(offset)
+    np.testing.assert_allclose(rms, np.sqrt(np.mean(ref * ref)), rtol=1e-9)
+    np.testing.assert_allclose(kurtosis, stats.kurtosis(ref), rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.parametrize("value", [1234.5, 0.0])
+def test_time_block_flat_input_is_nan(value):
+    """一定値（センサ断線など）の入力は scipy と同様に尖度が nan になること"""
+    flat = np.full(2500, value, dtype=np.float32)
+    assert np.isnan(VibrationFeatures.calc_time_block(flat)[1])
+    assert np.isnan(stats.kurtosis(flat))
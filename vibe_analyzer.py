@@ -1,6 +1,83 @@
+import functools
 import numpy as np
+import scipy.fft
 from scipy import stats
 
+try:
+    import numba
+except ImportError:  # numba が無い環境では NumPy 版で計算する
+    numba = None
+
+
+@functools.lru_cache(maxsize=8)
+def _win_freq(n, fs, dtype=np.float64):
+    """ハニング窓・周波数軸・FFT長のキャッシュ（チャンク長と fs は通常一定なので毎回作らない）"""
+    # FFT長は小さな素因数だけからなる高速なサイズに切り上げる（不足分はゼロ詰め）
+    n_fft = scipy.fft.next_fast_len(n, real=True)
+    # 入力と同じ浮動小数点精度にしておかないと float32 のデータが float64 に昇格してしまう
+    window = np.hanning(n).astype(dtype)
+    frequencies = np.fft.rfftfreq(n_fft, d=1/fs).astype(dtype)
+    # キャッシュを共有するので書き換えられないようにしておく
+    window.flags.writeable = False
+    frequencies.flags.writeable = False
+    return window, frequencies, n_fft
+
+
+if numba is not None:
+    # 戻り値に nan を使うので、nan/inf を仮定しない最適化 (nnan, ninf) は外しておく
+    @numba.njit(cache=True, fastmath={'reassoc', 'contract', 'arcp', 'nsz'}, boundscheck=False)
+    def _fused_time_features(data, resolution):
+        """1回の走査で (RMS, 尖度) をまとめて返す"""
+        n = data.size
+        if n == 0:
+            return np.nan, np.nan
+        # 先頭の値を引いてから累積する (shifted-data algorithm)
+        # 直流成分が大きい信号でも、生の累乗和から中心モーメントを出す時の桁落ちを防ぐ
+        shift = float(data[0])
+        sq = 0.0
+        s1 = 0.0
+        s2 = 0.0
+        s3 = 0.0
+        s4 = 0.0
+        for i in range(n):
+            # 累積は倍精度で行う（float32 のままだと4乗和の桁落ちが大きい）
+            x = float(data[i])
+            sq += x * x
+            d = x - shift
+            d2 = d * d
+            s1 += d
+            s2 += d2
+            s3 += d2 * d
+            s4 += d2 * d2
+        rms = np.sqrt(sq / n)
+
+        # シフト後のモーメントから中心モーメントに変換（分散・尖度はシフトに依存しない）
+        mean_d = s1 / n
+        m2 = s2 / n - mean_d * mean_d
+        # scipy.stats.kurtosis と同じ「分散がほぼ0」の判定（一定値の入力は nan）
+        mean = shift + mean_d
+        if m2 <= (resolution * mean) ** 2:
+            return rms, np.nan
+        m4 = s4 / n - 4.0 * mean_d * s3 / n + 6.0 * mean_d * mean_d * s2 / n - 3.0 * mean_d ** 4
+        # scipy.stats.kurtosis のデフォルト (fisher=True, bias=True) と同じ定義
+        return rms, m4 / (m2 * m2) - 3.0
+else:
+    def _fused_time_features(data, resolution):
+        """(RMS, 尖度) をまとめて返す（numba 無し版）"""
+        x = np.asarray(data, dtype=np.float64)
+        n = x.size
+        if n == 0:
+            return np.nan, np.nan
+        rms = np.sqrt(np.dot(x, x) / n)
+        mean = x.mean()
+        deviation = x - mean
+        d2 = deviation * deviation
+        m2 = d2.mean()
+        if m2 <= (resolution * mean) ** 2:
+            return rms, np.nan
+        return rms, np.dot(d2, d2) / n / (m2 * m2) - 3.0
+
+
 class VibrationFeatures:
     """振動データの各種特徴量を計算するライブラリ"""
 
@@ -8,7 +85,8 @@ class VibrationFeatures:
     def calc_rms(data):
         """実効値 (Root Mean Square) の計算"""
         # RMSは時間領域のエネルギーなので窓関数は不要
-        return np.sqrt(np.mean(np.square(data)))
+        # 二乗和を内積 (BLAS の dot, float32 なら sdot) で直接求め、二乗の中間配列を作らない
+        return np.sqrt(np.dot(data, data) / data.size)
 
     @staticmethod
     def calc_kurtosis(data):
@@ -17,22 +95,53 @@ class VibrationFeatures:
         return stats.kurtosis(data)
 
     @staticmethod
-    def calc_spectral_centroid(data, fs):
+    def calc_time_block(data):
         """
-        窓関数を適用した重心周波数 (Spectral Centroid) の計算
+        実効値と尖度をまとめて計算（データの走査を1回にまとめた融合カーネル）
+
+        Returns:
+            (rms, kurtosis): calc_rms, calc_kurtosis と同じ定義の値（倍精度で累積するため丸め誤差の範囲で一致）
+        """
+        # 分散ゼロ判定の分解能は scipy.stats.kurtosis と同じく入力の浮動小数点精度に合わせる
+        resolution = np.finfo(np.result_type(data.dtype, np.float32)).resolution
+        return _fused_time_features(data, resolution)
+
+    @staticmethod
+    def calc_spectrum(data, fs):
+        """
+        窓関数を適用した振幅スペクトルの計算
+        複数のスペクトル系特徴量で同じFFT結果を使い回すために切り出している
+
+        Returns:
+            (frequencies, spectrum): 周波数軸と振幅スペクトル
         """
         # 1. 窓関数（ハニング窓）の適用
         # データの両端をスムーズに0に落とし、周波数リーケージを抑制する
-        window = np.hanning(len(data))
+        # float32/float64 の入力はその精度のまま、整数の入力は浮動小数点に上げて計算する
+        window, frequencies, n_fft = _win_freq(len(data), fs, np.result_type(data.dtype, np.float32))
         windowed_data = data * window
         
-        # 2. FFT実行 (Real FFT)
-        spectrum = np.abs(np.fft.rfft(windowed_data))
-        frequencies = np.fft.rfftfreq(len(data), d=1/fs)
+        # 2. FFT実行 (Real FFT, マルチスレッド, 高速なFFT長までゼロ詰め)
+        spectrum = np.abs(scipy.fft.rfft(windowed_data, n=n_fft, workers=-1))
+        return frequencies, spectrum
+
+    @staticmethod
+    def calc_spectral_centroid(data, fs, spectrum=None):
+        """
+        窓関数を適用した重心周波数 (Spectral Centroid) の計算
+
+        Args:
+            spectrum: calc_spectrum の計算結果。渡された場合はFFTを省略する
+        """
+        if spectrum is None:
+            spectrum = VibrationFeatures.calc_spectrum(data, fs)
+        frequencies, spectrum = spectrum
         
         # 3. 重心計算: Σ(周波数 * 強度) / Σ(強度)
+        # スペクトルが実質すべて0（入力が0のみ）の時は重心が定義できないので0とする
+        # ゼロ詰めは周波数軸を細かく補間するだけで、重心の値自体はほとんど変わらない
         sum_spectrum = np.sum(spectrum)
-        if sum_spectrum == 0:
+        if sum_spectrum <= np.finfo(spectrum.dtype).tiny:
             return 0
             
-        return np.sum(frequencies * spectrum) / sum_spectrum
\ No newline at end of file
+        return np.sum(frequencies * spectrum) / sum_spectrum